@@ -4,6 +4,7 @@ from torch.nn import Sequential
 from torch.nn import Tanh
 
 from Layers.Conformer import Conformer
+from Layers.CurveEmbedding import enrich_with_curves
 from Layers.DurationPredictor import DurationPredictor
 from Layers.LengthRegulator import LengthRegulator
 from Layers.PostNet import PostNet
@@ -82,6 +83,14 @@ class ToucanTTS(torch.nn.Module):
         self.use_scaled_pos_enc = use_scaled_positional_encoding
         self.multilingual_model = lang_embs is not None
         self.multispeaker_model = utt_embed_dim is not None
+        feature_to_index = get_feature_to_index_lookup()
+        self._voiced_idx = feature_to_index["voiced"]
+        self._phoneme_idx = feature_to_index["phoneme"]
+        self._word_boundary_idx = feature_to_index["word-boundary"]
+        self._silence_idx = feature_to_index["silence"]
+        self._predictor_streams = None  # only used if to_inference is asked to overlap the predictors
+        self._forward_is_compiled = False  # set by to_inference, the compiled forward pass avoids everything that dynamo can't trace
+        self.autocast_dtype = None  # can be set to torch.float16 or torch.bfloat16 to run the encoder, the predictors and the decoder in half precision
 
         articulatory_feature_embedding = Sequential(Linear(input_feature_dimensions, 100), Tanh(), Linear(100, attention_dimension))
         self.encoder = Conformer(idim=input_feature_dimensions,
@@ -177,7 +186,8 @@ class ToucanTTS(torch.nn.Module):
             condition_integration_projection=torch.nn.Conv1d(output_spectrogram_channels + attention_dimension, attention_dimension, 5, padding=2)
         )
 
-        self.load_state_dict(weights)
+        if weights is not None:
+            self.load_state_dict(weights)
         self.eval()
 
     def _forward(self,
@@ -191,45 +201,41 @@ class ToucanTTS(torch.nn.Module):
                  lang_ids=None,
                  pitch_variance_scale=1.0,
                  energy_variance_scale=1.0,
-                 pause_duration_scaling_factor=1.0):
+                 pause_duration_scaling_factor=1.0,
+                 encoded_texts=None):
 
-        if not self.multilingual_model:
-            lang_ids = None
-
-        if not self.multispeaker_model:
-            utterance_embedding = None
-        else:
-            utterance_embedding = torch.nn.functional.normalize(utterance_embedding)
+        utterance_embedding, lang_ids = self._prepare_conditioning(utterance_embedding, lang_ids)
 
         # encoding the texts
-        text_masks = make_non_pad_mask(text_lengths, device=text_lengths.device).unsqueeze(-2)
-        encoded_texts, _ = self.encoder(text_tensors, text_masks, utterance_embedding=utterance_embedding, lang_ids=lang_ids)
+        if encoded_texts is None:
+            encoded_texts = self._encode(text_tensors, text_lengths, utterance_embedding, lang_ids)
 
         # predicting pitch, energy and durations
-        pitch_predictions = self.pitch_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_pitch is None else gold_pitch
-        energy_predictions = self.energy_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_energy is None else gold_energy
-        predicted_durations = self.duration_predictor.inference(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_durations is None else gold_durations
+        pitch_predictions, energy_predictions, predicted_durations = self._predict_variances(encoded_texts,
+                                                                                             utterance_embedding,
+                                                                                             gold_pitch,
+                                                                                             gold_energy,
+                                                                                             gold_durations)
 
         # modifying the predictions with linguistic knowledge and control parameters
-        for phoneme_index, phoneme_vector in enumerate(text_tensors.squeeze(0)):
-            if phoneme_vector[get_feature_to_index_lookup()["voiced"]] == 0:
-                pitch_predictions[0][phoneme_index] = 0.0
-            if phoneme_vector[get_feature_to_index_lookup()["phoneme"]] == 0:
-                energy_predictions[0][phoneme_index] = 0.0
-            if phoneme_vector[get_feature_to_index_lookup()["word-boundary"]] == 1:
-                predicted_durations[0][phoneme_index] = 0
-            if phoneme_vector[get_feature_to_index_lookup()["silence"]] == 1 and pause_duration_scaling_factor != 1.0:
-                predicted_durations[0][phoneme_index] = torch.round(predicted_durations[0][phoneme_index].float() * pause_duration_scaling_factor).long()
+        apply_linguistic_rules = _apply_linguistic_rules if self._forward_is_compiled else _scripted_linguistic_rules
+        pitch_predictions, energy_predictions, predicted_durations = apply_linguistic_rules(text_tensors,
+                                                                                            pitch_predictions,
+                                                                                            energy_predictions,
+                                                                                            predicted_durations,
+                                                                                            self._voiced_idx,
+                                                                                            self._phoneme_idx,
+                                                                                            self._word_boundary_idx,
+                                                                                            self._silence_idx,
+                                                                                            float(pause_duration_scaling_factor))
         if duration_scaling_factor != 1.0:
             assert duration_scaling_factor > 0
             predicted_durations = torch.round(predicted_durations.float() * duration_scaling_factor).long()
-        pitch_predictions = _scale_variance(pitch_predictions, pitch_variance_scale)
-        energy_predictions = _scale_variance(energy_predictions, energy_variance_scale)
+        pitch_predictions = _scale_variance(pitch_predictions.float(), pitch_variance_scale)
+        energy_predictions = _scale_variance(energy_predictions.float(), energy_variance_scale)
 
         # enriching the text with pitch and energy info
-        embedded_pitch_curve = self.pitch_embed(pitch_predictions.transpose(1, 2)).transpose(1, 2)
-        embedded_energy_curve = self.energy_embed(energy_predictions.transpose(1, 2)).transpose(1, 2)
-        enriched_encoded_texts = encoded_texts + embedded_pitch_curve + embedded_energy_curve
+        enriched_encoded_texts = enrich_with_curves(encoded_texts, self.pitch_embed, self.energy_embed, pitch_predictions, energy_predictions)
 
         # predicting durations for text and upsampling accordingly
         upsampled_enriched_encoded_texts = self.length_regulator(enriched_encoded_texts, predicted_durations)
@@ -240,14 +246,85 @@ class ToucanTTS(torch.nn.Module):
 
         refined_spectrogram = decoded_spectrogram + self.conv_postnet(decoded_spectrogram.transpose(1, 2)).transpose(1, 2)
 
-        # refine spectrogram
-        refined_spectrogram = self.post_flow(tgt_mels=None,
-                                             infer=True,
-                                             mel_out=refined_spectrogram,
-                                             encoded_texts=upsampled_enriched_encoded_texts,
-                                             tgt_nonpadding=None).squeeze()
+        # refine spectrogram (the invertible flow is always run in full precision)
+        with torch.autocast(device_type=refined_spectrogram.device.type, enabled=False):
+            refined_spectrogram = self.post_flow(tgt_mels=None,
+                                                 infer=True,
+                                                 mel_out=refined_spectrogram.float(),
+                                                 encoded_texts=upsampled_enriched_encoded_texts.float(),
+                                                 tgt_nonpadding=None)
+
+        return decoded_spectrogram.float(), refined_spectrogram, predicted_durations, pitch_predictions, energy_predictions
+
+    def _predict_variances(self, encoded_texts, utterance_embedding, gold_pitch, gold_energy, gold_durations):
+        if self._predictor_streams is None or not encoded_texts.is_cuda or self._forward_is_compiled:
+            pitch_predictions = self.pitch_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_pitch is None else gold_pitch
+            energy_predictions = self.energy_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_energy is None else gold_energy
+            predicted_durations = self.duration_predictor.inference(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_durations is None else gold_durations
+            return pitch_predictions, energy_predictions, predicted_durations
+
+        # the predictors are small and independent of each other, so they can be launched on separate streams to overlap
+        predictions = [lambda: self.pitch_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_pitch is None else gold_pitch,
+                       lambda: self.energy_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_energy is None else gold_energy,
+                       lambda: self.duration_predictor.inference(encoded_texts, padding_mask=None, utt_embed=utterance_embedding) if gold_durations is None else gold_durations]
+        main_stream = torch.cuda.current_stream(encoded_texts.device)
+        results = list()
+        for prediction, stream in zip(predictions, self._predictor_streams):
+            stream.wait_stream(main_stream)
+            with torch.cuda.stream(stream):
+                results.append(prediction())
+        for result, stream in zip(results, self._predictor_streams):
+            main_stream.wait_stream(stream)
+            result.record_stream(main_stream)
+        return results
+
+    def _prepare_conditioning(self, utterance_embedding, lang_ids):
+        if not self.multilingual_model:
+            lang_ids = None
+
+        if not self.multispeaker_model:
+            utterance_embedding = None
+        else:
+            utterance_embedding = torch.nn.functional.normalize(utterance_embedding)
+        return utterance_embedding, lang_ids
+
+    def _encode(self, text_tensors, text_lengths, utterance_embedding, lang_ids):
+        if text_tensors.size(0) == 1:
+            text_masks = None  # a single sequence has no padding, so there is nothing to mask
+        else:
+            text_masks = make_non_pad_mask(text_lengths, device=text_lengths.device).unsqueeze(-2)
+        encoded_texts, _ = self.encoder(text_tensors,
+                                        text_masks,
+                                        utterance_embedding=utterance_embedding,
+                                        lang_ids=lang_ids,
+                                        utterance_embedding_is_normalized=True)  # normalized in _prepare_conditioning, it is shared with the variance predictors
+        return encoded_texts
+
+    @torch.inference_mode()
+    def encode(self,
+               text,
+               utterance_embedding=None,
+               lang_id=None):
+        """
+        Encode the sequence of vectorized phonemes, so the result can be passed to forward as encoded_texts.
+        This is useful to synthesize the same text multiple times with different prosody, since the
+        encoder is only dependent on the text, the utterance embedding and the language.
+
+        Args:
+            text: input sequence of vectorized phonemes
+            utterance_embedding: embedding of speaker information
+            lang_id: id to be fed into the embedding layer that contains language information
+
+        Returns:
+            encoded text with a batch axis
 
-        return decoded_spectrogram.squeeze(), refined_spectrogram.squeeze(), predicted_durations.squeeze(), pitch_predictions.squeeze(), energy_predictions.squeeze()
+        """
+        text_length = torch.tensor([text.shape[0]], dtype=torch.long, device=text.device)
+        if lang_id is not None:
+            lang_id = lang_id.unsqueeze(0).to(text.device)
+        utterance_embedding, lang_id = self._prepare_conditioning(utterance_embedding.unsqueeze(0) if utterance_embedding is not None else None, lang_id)
+        with torch.autocast(device_type=text.device.type, dtype=self.autocast_dtype, enabled=self.autocast_dtype is not None):
+            return self._encode(text.unsqueeze(0), text_length, utterance_embedding, lang_id)
 
     @torch.inference_mode()
     def forward(self,
@@ -261,7 +338,8 @@ class ToucanTTS(torch.nn.Module):
                 duration_scaling_factor=1.0,
                 pitch_variance_scale=1.0,
                 energy_variance_scale=1.0,
-                pause_duration_scaling_factor=1.0):
+                pause_duration_scaling_factor=1.0,
+                encoded_texts=None):
         """
         Generate the sequence of spectrogram frames given the sequence of vectorized phonemes.
 
@@ -284,6 +362,8 @@ class ToucanTTS(torch.nn.Module):
                                    lower values decrease variance of the energy curve.
             pause_duration_scaling_factor: reasonable values are 0.6 < scale < 1.4.
                                    scales the durations of pauses on top of the regular duration scaling
+            encoded_texts: output of encode for the same text, utterance embedding and language (optional, if not
+                           provided, the text will be encoded again)
 
         Returns:
             mel spectrogram
@@ -300,23 +380,28 @@ class ToucanTTS(torch.nn.Module):
         if lang_id is not None:
             lang_id = lang_id.unsqueeze(0).to(text.device)
 
-        before_outs, \
-        after_outs, \
-        predicted_durations, \
-        pitch_predictions, \
-        energy_predictions = self._forward(text.unsqueeze(0),
-                                           text_length,
-                                           gold_durations=durations,
-                                           gold_pitch=pitch,
-                                           gold_energy=energy,
-                                           utterance_embedding=utterance_embedding.unsqueeze(0) if utterance_embedding is not None else None, lang_ids=lang_id,
-                                           duration_scaling_factor=duration_scaling_factor,
-                                           pitch_variance_scale=pitch_variance_scale,
-                                           energy_variance_scale=energy_variance_scale,
-                                           pause_duration_scaling_factor=pause_duration_scaling_factor)
+        # dynamo caches the compiled code of _forward, so wrapping it again on every call only compiles on the first calls
+        forward_pass = torch.compile(self._forward, dynamic=True) if self._forward_is_compiled else self._forward
+        with torch.autocast(device_type=text.device.type, dtype=self.autocast_dtype, enabled=self.autocast_dtype is not None):
+            before_outs, \
+            after_outs, \
+            predicted_durations, \
+            pitch_predictions, \
+            energy_predictions = forward_pass(text.unsqueeze(0),
+                                              text_length,
+                                              gold_durations=durations,
+                                              gold_pitch=pitch,
+                                              gold_energy=energy,
+                                              utterance_embedding=utterance_embedding.unsqueeze(0) if utterance_embedding is not None else None, lang_ids=lang_id,
+                                              duration_scaling_factor=duration_scaling_factor,
+                                              pitch_variance_scale=pitch_variance_scale,
+                                              energy_variance_scale=energy_variance_scale,
+                                              pause_duration_scaling_factor=pause_duration_scaling_factor,
+                                              encoded_texts=encoded_texts)
+        # removing the batch axis again
         if return_duration_pitch_energy:
-            return after_outs, predicted_durations, pitch_predictions, energy_predictions
-        return after_outs
+            return after_outs.squeeze(), predicted_durations.squeeze(), pitch_predictions.squeeze(), energy_predictions.squeeze()
+        return after_outs.squeeze()
 
     def store_inverse_all(self):
         def remove_weight_norm(m):
@@ -329,15 +414,146 @@ class ToucanTTS(torch.nn.Module):
 
         self.apply(remove_weight_norm)
 
+    def to_inference(self, device, half_precision=False, compile_forward=False, overlap_predictors=False):
+        """
+        Prepare the model for inference on the given device.
+
+        Args:
+            device: the device to move the model to, either as a torch.device or as a string like "cuda"
+            half_precision: whether to run the encoder, the predictors and the decoder in float16 autocast and to store
+                            the language embedding table in float16. Only has an effect on CUDA, the post-flow
+                            always stays in full precision.
+            compile_forward: whether to compile the forward pass with torch.compile. The first calls are slow,
+                             because they trigger the compilation, so this is only worth it for longer running processes.
+                             The upsampling to the predicted durations has a data-dependent output size, so the
+                             compiled forward pass is split into graphs before and after it.
+            overlap_predictors: whether to launch the pitch, energy and duration predictors on separate CUDA streams.
+                                For a single sentence the predictors are so small that the launches dominate, so
+                                whether the overlap outweighs the additional synchronization has to be measured on the
+                                hardware in question. Off by default, and ignored by a compiled forward pass.
+
+        Returns:
+            the model itself
+        """
+        device = torch.device(device)  # the interfaces pass their devices as strings as well
+        with torch.no_grad():
+            self.store_inverse_all()  # this also removes weight norm
+        self.to(device)
+        self.autocast_dtype = torch.float16 if half_precision and device.type == "cuda" else None
+        if self.multilingual_model:
+            # the language embedding table is only read by lookups, so it can be stored in half precision when the model runs in it.
+            # The encoder casts the looked up vectors to the dtype of its activations, so full precision calls still work with such a table,
+            # calling this again without half precision stores the table in full precision again.
+            self.encoder.language_embedding.to(self.autocast_dtype if self.autocast_dtype is not None else torch.float32)
+        self._predictor_streams = [torch.cuda.Stream(device=device) for _ in range(3)] if overlap_predictors and device.type == "cuda" else None
+        if compile_forward:
+            # dynamic shapes avoid a recompilation for every new text length. The graphs are split at the upsampling
+            # and their sizes change with every text, so there is nothing that could be captured in CUDA graphs.
+            self._forward_is_compiled = True  # only a flag, the forward pass is wrapped when it is called, so the module itself stays picklable
+        return self
+
+    def export_onnx(self, path, utterance_embedding=None, lang_id=None, opset_version=17):
+        """
+        Export the model to ONNX, e.g. for inference on CPU with ONNX Runtime. The exported graph takes a batch of one
+        sequence of vectorized phonemes and, if the model uses them, the utterance embedding and the language id.
+        It returns the spectrogram, the control parameters of forward are fixed to their defaults.
+
+        ONNX Runtime can fuse the attention of the Conformers into single multi-threaded nodes. To apply this, run its
+        transformer optimizer on the exported file, for example:
+            python -m onnxruntime.transformers.optimizer --input toucan.onnx --output toucan_optimized.onnx --model_type bert
+
+        Args:
+            path: where to save the exported model
+            utterance_embedding: embedding used as example input for the export, a random one is used if this is None
+                                 and the model is multispeaker
+            lang_id: language id used as example input for the export, the first language is used if this is None and
+                     the model is multilingual
+            opset_version: the ONNX opset to export to
+        """
+        with torch.no_grad():
+            self.store_inverse_all()  # weight norm and the inversion of the flow are not exportable, so they are baked in
+        self.eval()
+        device = next(self.parameters()).device
+        dummy_text = torch.zeros([1, 16, self.input_feature_dimensions], device=device)
+        dummy_text[:, :, self._phoneme_idx] = 1  # voiced phonemes, so the linguistic rules don't zero out all durations while tracing
+        dummy_text[:, :, self._voiced_idx] = 1
+        inputs = [dummy_text]
+        input_names = ["text"]
+        dynamic_axes = {"text": {1: "phonemes"}, "spectrogram": {1: "frames"}}
+        if self.multispeaker_model:
+            if utterance_embedding is None:
+                utterance_embedding = torch.randn([self.encoder.utt_embed], device=device)
+            inputs.append(utterance_embedding.view(1, -1).to(device))
+            input_names.append("utterance_embedding")
+        if self.multilingual_model:
+            if lang_id is None:
+                lang_id = torch.zeros([1], dtype=torch.long)
+            inputs.append(lang_id.view(1).to(device))
+            input_names.append("lang_id")
+        torch.onnx.export(_ONNXExportWrapper(self),
+                          tuple(inputs),
+                          path,
+                          input_names=input_names,
+                          output_names=["spectrogram"],
+                          dynamic_axes=dynamic_axes,
+                          opset_version=opset_version)
+
+
+class _ONNXExportWrapper(torch.nn.Module):
+    """
+    Binds the inputs of the exported graph to the arguments of _forward by position,
+    since torch.onnx.export can only pass tensors to the module it exports.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, text_tensors, *conditioning):
+        # a single sequence is never masked, so its length is only there to satisfy the signature of _forward
+        text_lengths = torch.tensor([text_tensors.size(1)], dtype=torch.long, device=text_tensors.device)
+        conditioning = list(conditioning)
+        utterance_embedding = conditioning.pop(0) if self.model.multispeaker_model else None
+        lang_ids = conditioning.pop(0) if self.model.multilingual_model else None
+        _, refined_spectrogram, _, _, _ = self.model._forward(text_tensors,
+                                                              text_lengths,
+                                                              utterance_embedding=utterance_embedding,
+                                                              lang_ids=lang_ids)
+        return refined_spectrogram
+
+
+def _apply_linguistic_rules(phoneme_vectors: torch.Tensor,
+                            pitch: torch.Tensor,
+                            energy: torch.Tensor,
+                            durations: torch.Tensor,
+                            voiced_idx: int,
+                            phoneme_idx: int,
+                            word_boundary_idx: int,
+                            silence_idx: int,
+                            pause_duration_scaling_factor: float):
+    # the masks cover the whole batch at once, so this costs a handful of fused kernels regardless of the length of the text.
+    # phoneme_vectors is (B, T, F), every sequence is masked according to its own phonemes
+    pitch = torch.where((phoneme_vectors[:, :, voiced_idx] == 0).unsqueeze(-1), torch.zeros_like(pitch), pitch)
+    energy = torch.where((phoneme_vectors[:, :, phoneme_idx] == 0).unsqueeze(-1), torch.zeros_like(energy), energy)
+    durations = torch.where(phoneme_vectors[:, :, word_boundary_idx] == 1, torch.zeros_like(durations), durations)
+    if pause_duration_scaling_factor != 1.0:
+        durations = torch.where(phoneme_vectors[:, :, silence_idx] == 1,
+                                torch.round(durations.float() * pause_duration_scaling_factor).long(),
+                                durations)
+    return pitch, energy, durations
+
+
+# scripted for the eager forward pass, where it fuses the masking. dynamo can't trace into a ScriptFunction, so the compiled forward pass uses the plain function.
+_scripted_linguistic_rules = torch.jit.script(_apply_linguistic_rules)
+
 
 def _scale_variance(sequence, scale):
     if scale == 1.0:
         return sequence
-    average = sequence[0][sequence[0] != 0.0].mean()
+    # the average of the non-zero values of every sequence on its own, (B, 1, 1) for curves of shape (B, T, 1)
+    nonzero = sequence != 0.0
+    average = (sequence * nonzero).sum(dim=1, keepdim=True) / nonzero.sum(dim=1, keepdim=True).clamp_min(1)
     sequence = sequence - average  # center sequence around 0
     sequence = sequence * scale  # scale the variance
     sequence = sequence + average  # move center back to original with changed variance
-    for sequence_index in range(len(sequence[0])):
-        if sequence[0][sequence_index] < 0.0:
-            sequence[0][sequence_index] = 0.0
-    return sequence
+    return sequence.clamp_min(0.0)  # values that were pushed below 0 are set to 0
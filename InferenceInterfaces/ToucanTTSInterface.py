@@ -61,9 +61,7 @@ class ToucanTTSInterface(torch.nn.Module):
                 self.phone2mel = ToucanTTS(weights=checkpoint["model"], lang_embs=None)  # multi speaker single language
             except RuntimeError:
                 self.phone2mel = ToucanTTS(weights=checkpoint["model"], lang_embs=None, utt_embed_dim=None)  # single speaker
-        with torch.no_grad():
-            self.phone2mel.store_inverse_all()  # this also removes weight norm
-        self.phone2mel = self.phone2mel.to(torch.device(device))
+        self.phone2mel = self.phone2mel.to_inference(torch.device(device))
 
         #################################
         #  load mel to style models     #
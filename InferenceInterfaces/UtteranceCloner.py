@@ -97,8 +97,9 @@ class UtteranceCloner:
         # We note the index of word boundaries and insert durations of 0 afterwards
         text_without_word_boundaries = list()
         indexes_of_word_boundaries = list()
+        word_boundary_index = get_feature_to_index_lookup()["word-boundary"]
         for phoneme_index, vector in enumerate(text):
-            if vector[get_feature_to_index_lookup()["word-boundary"]] == 0:
+            if vector[word_boundary_index] == 0:
                 text_without_word_boundaries.append(vector.numpy().tolist())
             else:
                 indexes_of_word_boundaries.append(phoneme_index)
@@ -6,12 +6,13 @@
 
 import math
 
-import numpy
 import torch
 from torch import nn
 
 from Utility.utils import make_non_pad_mask
 
+_FUSED_ATTENTION_AVAILABLE = hasattr(torch.nn.functional, "scaled_dot_product_attention")  # only exists from torch 2.0 onwards
+
 
 class MultiHeadedAttention(nn.Module):
     """
@@ -32,9 +33,7 @@ class MultiHeadedAttention(nn.Module):
         # We assume d_v always equals d_k
         self.d_k = n_feat // n_head
         self.h = n_head
-        self.linear_q = nn.Linear(n_feat, n_feat)
-        self.linear_k = nn.Linear(n_feat, n_feat)
-        self.linear_v = nn.Linear(n_feat, n_feat)
+        self.linear_qkv = nn.Linear(n_feat, 3 * n_feat)  # the projections of query, key and value stacked, so self-attention needs a single matrix multiplication
         self.linear_out = nn.Linear(n_feat, n_feat)
         self.attn = None
         self.dropout = nn.Dropout(p=dropout_rate)
@@ -54,15 +53,33 @@ class MultiHeadedAttention(nn.Module):
             torch.Tensor: Transformed value tensor (#batch, n_head, time2, d_k).
         """
         n_batch = query.size(0)
-        q = self.linear_q(query).view(n_batch, -1, self.h, self.d_k)
-        k = self.linear_k(key).view(n_batch, -1, self.h, self.d_k)
-        v = self.linear_v(value).view(n_batch, -1, self.h, self.d_k)
+        if query is key and key is value:
+            q, k, v = self.linear_qkv(query).chunk(3, dim=-1)
+        else:
+            weight_q, weight_k, weight_v = self.linear_qkv.weight.chunk(3, dim=0)
+            bias_q, bias_k, bias_v = self.linear_qkv.bias.chunk(3, dim=0)
+            q = torch.nn.functional.linear(query, weight_q, bias_q)
+            k = torch.nn.functional.linear(key, weight_k, bias_k)
+            v = torch.nn.functional.linear(value, weight_v, bias_v)
+        q = q.reshape(n_batch, -1, self.h, self.d_k)
+        k = k.reshape(n_batch, -1, self.h, self.d_k)
+        v = v.reshape(n_batch, -1, self.h, self.d_k)
         q = q.transpose(1, 2)  # (batch, head, time1, d_k)
         k = k.transpose(1, 2)  # (batch, head, time2, d_k)
         v = v.transpose(1, 2)  # (batch, head, time2, d_k)
 
         return q, k, v
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # checkpoints from before the projections were stacked store them as three separate linear layers.
+        # Subclasses with differently sized inputs keep the separate layers, so there is nothing to stack for them.
+        if hasattr(self, "linear_qkv"):
+            for parameter in ("weight", "bias"):
+                separate_keys = [prefix + name + "." + parameter for name in ("linear_q", "linear_k", "linear_v")]
+                if all(key in state_dict for key in separate_keys):
+                    state_dict[prefix + "linear_qkv." + parameter] = torch.cat([state_dict.pop(key) for key in separate_keys], dim=0)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward_attention(self, value, scores, mask):
         """
         Compute attention context vector.
@@ -79,7 +96,7 @@ class MultiHeadedAttention(nn.Module):
         n_batch = value.size(0)
         if mask is not None:
             mask = mask.unsqueeze(1).eq(0)  # (batch, 1, *, time2)
-            min_value = float(numpy.finfo(torch.tensor(0, dtype=scores.dtype).numpy().dtype).min)
+            min_value = torch.finfo(scores.dtype).min
             scores = scores.masked_fill(mask, min_value)
             self.attn = torch.softmax(scores, dim=-1).masked_fill(mask, 0.0)  # (batch, head, time1, time2)
         else:
@@ -91,6 +108,37 @@ class MultiHeadedAttention(nn.Module):
 
         return self.linear_out(x)  # (batch, time1, d_model)
 
+    def forward_fused_attention(self, query, key, value, mask, bias=None):
+        """
+        Compute attention context vector with the fused scaled dot product attention kernels of torch.
+
+        Args:
+            query (torch.Tensor): Transformed query (#batch, n_head, time1, d_k).
+            key (torch.Tensor): Transformed key (#batch, n_head, time2, d_k).
+            value (torch.Tensor): Transformed value (#batch, n_head, time2, d_k).
+            mask (torch.Tensor): Mask (#batch, 1, time2) or (#batch, time1, time2).
+            bias (torch.Tensor): Scaled scores that are added to the attention scores (#batch, n_head, time1, time2).
+
+        Returns:
+            torch.Tensor: Transformed value (#batch, time1, d_model)
+                weighted by the attention score (#batch, time1, time2).
+        """
+        n_batch = value.size(0)
+        attn_mask = bias
+        if mask is not None:
+            mask = mask.unsqueeze(1).eq(0)  # (batch, 1, *, time2)
+            if bias is None:
+                attn_mask = ~mask  # boolean masks mark the positions that are kept
+            else:
+                min_value = torch.finfo(bias.dtype).min
+                attn_mask = bias.masked_fill(mask, min_value)
+        x = torch.nn.functional.scaled_dot_product_attention(query, key, value,
+                                                             attn_mask=attn_mask,
+                                                             dropout_p=self.dropout.p if self.training else 0.0)  # (batch, head, time1, d_k)
+        x = x.transpose(1, 2).reshape(n_batch, -1, self.h * self.d_k)  # (batch, time1, d_model)
+
+        return self.linear_out(x)  # (batch, time1, d_model)
+
     def forward(self, query, key, value, mask):
         """
         Compute scaled dot product attention.
@@ -106,6 +154,8 @@ class MultiHeadedAttention(nn.Module):
             torch.Tensor: Output tensor (#batch, time1, d_model).
         """
         q, k, v = self.forward_qkv(query, key, value)
+        if _FUSED_ATTENTION_AVAILABLE:
+            return self.forward_fused_attention(q, k, v, mask)
         scores = torch.matmul(q, k.transpose(-2, -1)) / math.sqrt(self.d_k)
         return self.forward_attention(v, scores, mask)
 
@@ -144,8 +194,7 @@ class RelPositionMultiHeadedAttention(MultiHeadedAttention):
         Returns:
             torch.Tensor: Output tensor.
         """
-        zero_pad = torch.zeros((*x.size()[:3], 1), device=x.device, dtype=x.dtype)
-        x_padded = torch.cat([zero_pad, x], dim=-1)
+        x_padded = torch.nn.functional.pad(x, (1, 0))  # prepend a column of zeros, without allocating it separately and concatenating
 
         x_padded = x_padded.view(*x.size()[:2], x.size(3) + 1, x.size(2))
         x = x_padded[:, :, 1:].view_as(x)[:, :, :, : x.size(-1) // 2 + 1]  # only keep the positions from 0 to time2
@@ -183,16 +232,20 @@ class RelPositionMultiHeadedAttention(MultiHeadedAttention):
         q_with_bias_v = (q + self.pos_bias_v).transpose(1, 2)
 
         # compute attention score
-        # first compute matrix a and matrix c
+        # first compute matrix b and matrix d
         # as described in https://arxiv.org/abs/1901.02860 Section 3.3
-        # (batch, head, time1, time2)
-        matrix_ac = torch.matmul(q_with_bias_u, k.transpose(-2, -1))
-
-        # compute matrix b and matrix d
         # (batch, head, time1, 2*time1-1)
         matrix_bd = torch.matmul(q_with_bias_v, p.transpose(-2, -1))
         matrix_bd = self.rel_shift(matrix_bd)
 
+        if _FUSED_ATTENTION_AVAILABLE:
+            # matrix a and matrix c are computed inside of the fused attention, the positional scores are added to them as a bias
+            return self.forward_fused_attention(q_with_bias_u, k, v, mask, bias=matrix_bd / math.sqrt(self.d_k))
+
+        # then compute matrix a and matrix c
+        # (batch, head, time1, time2)
+        matrix_ac = torch.matmul(q_with_bias_u, k.transpose(-2, -1))
+
         scores = (matrix_ac + matrix_bd) / math.sqrt(self.d_k)  # (batch, head, time1, time2)
 
         return self.forward_attention(v, scores, mask)
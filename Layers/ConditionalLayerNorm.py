@@ -51,6 +51,15 @@ class ConditionalLayerNorm(nn.Module):
 
     def forward(self, x, speaker_embedding):
 
+        if self.dim == 1 and x.dim() == 3:
+            # channels first, as in the variance predictors: normalize over the channel axis
+            # directly instead of transposing the input and the output back and forth
+            mean = x.mean(dim=1, keepdim=True)
+            var = ((x - mean) ** 2).mean(dim=1, keepdim=True)
+            scale = self.W_scale(speaker_embedding)
+            bias = self.W_bias(speaker_embedding)
+            return scale.unsqueeze(-1) * ((x - mean) / var) + bias.unsqueeze(-1)
+
         if self.dim != -1:
             x = x.transpose(-1, self.dim)
 
@@ -93,11 +93,14 @@ class Conformer(torch.nn.Module):
                 xs,
                 masks,
                 utterance_embedding=None,
-                lang_ids=None):
+                lang_ids=None,
+                utterance_embedding_is_normalized=False):
         """
         Encode input sequence.
         Args:
             utterance_embedding: embedding containing lots of conditioning signals
+            utterance_embedding_is_normalized: whether the caller has normalized the utterance embedding already,
+                                               otherwise it is normalized here
             lang_ids: ids of the languages per sample in the batch
             xs (torch.Tensor): Input tensor (#batch, time, idim).
             masks (torch.Tensor): Mask tensor (#batch, time).
@@ -110,7 +113,7 @@ class Conformer(torch.nn.Module):
             xs = self.embed(xs)
 
         if lang_ids is not None:
-            lang_embs = self.language_embedding(lang_ids)
+            lang_embs = self.language_embedding(lang_ids).to(xs.dtype)  # the table may be stored in a different precision than the activations, the lookup is matched to them
             xs = xs + lang_embs  # offset phoneme representation by language specific offset
 
         xs = self.pos_enc(xs)
@@ -123,12 +126,16 @@ class Conformer(torch.nn.Module):
             xs = self.output_norm(xs)
 
         if self.utt_embed:
+            if not utterance_embedding_is_normalized:
+                utterance_embedding = torch.nn.functional.normalize(utterance_embedding)
             xs = self._integrate_with_utt_embed(hs=xs, utt_embeddings=utterance_embedding)
 
         return xs, masks
 
     def _integrate_with_utt_embed(self, hs, utt_embeddings):
-        # concat hidden states with spk embeds and then apply projection
-        embeddings_expanded = torch.nn.functional.normalize(utt_embeddings).unsqueeze(1).expand(-1, hs.size(1), -1)
-        hs = self.hs_emb_projection(torch.cat([hs, embeddings_expanded], dim=-1))
+        # project hidden states and spk embeds with the respective slices of the projection (equivalent to concatenating them first),
+        # so the embedding is projected once per utterance instead of once per frame
+        hs_weight, emb_weight = self.hs_emb_projection.weight.split([hs.size(-1), self.utt_embed], dim=-1)
+        projected_embeddings = torch.nn.functional.linear(utt_embeddings, emb_weight, self.hs_emb_projection.bias)
+        hs = torch.nn.functional.linear(hs, hs_weight) + projected_embeddings.unsqueeze(1)
         return hs
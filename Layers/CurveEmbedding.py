@@ -0,0 +1,37 @@
+import torch
+
+
+def enrich_with_curves(encoded_texts, pitch_embed, energy_embed, pitch_curve, energy_curve):
+    """
+    Adds the embeddings of the pitch and energy curves onto the encoded texts.
+
+    Args:
+        encoded_texts: the output of the encoder (B, T, adim)
+        pitch_embed: Sequential of the Conv1d that embeds the pitch curve and its Dropout
+        energy_embed: Sequential of the Conv1d that embeds the energy curve and its Dropout
+        pitch_curve: pitch per token (B, T, 1)
+        energy_curve: energy per token (B, T, 1)
+
+    Returns:
+        the encoded texts enriched with the pitch and energy information (B, T, adim)
+    """
+    pitch_convolution, pitch_dropout = pitch_embed
+    energy_convolution, energy_dropout = energy_embed
+    dropout_active = pitch_embed.training and (pitch_dropout.p > 0.0 or energy_dropout.p > 0.0)
+    if pitch_convolution.kernel_size[0] != 1 or energy_convolution.kernel_size[0] != 1 or dropout_active:
+        return encoded_texts + embed_curve(pitch_embed, pitch_curve) + embed_curve(energy_embed, energy_curve)
+    # with a kernel size of 1 and no dropout, embedding a curve is just scaling the weight vector by it and adding the bias,
+    # so both embeddings and the residual connection collapse into two multiply-adds (or one fused kernel, if the forward is compiled)
+    dtype = encoded_texts.dtype
+    enriched_encoded_texts = encoded_texts + (pitch_convolution.bias + energy_convolution.bias).to(dtype)
+    enriched_encoded_texts = torch.addcmul(enriched_encoded_texts, pitch_curve.to(dtype), pitch_convolution.weight.view(1, 1, -1).to(dtype))
+    return torch.addcmul(enriched_encoded_texts, energy_curve.to(dtype), energy_convolution.weight.view(1, 1, -1).to(dtype))
+
+
+def embed_curve(embedding, curve):
+    convolution, dropout = embedding
+    if convolution.kernel_size[0] == 1:
+        # a convolution with a kernel size of 1 is a linear layer over the channel axis,
+        # so it can be applied to the curve in its (batch, time, 1) layout without transposing back and forth
+        return dropout(torch.nn.functional.linear(curve, convolution.weight.squeeze(-1), convolution.bias))
+    return embedding(curve.transpose(1, 2)).transpose(1, 2)
@@ -6,8 +6,6 @@ from abc import ABC
 
 import torch
 
-from Utility.utils import pad_list
-
 
 class LengthRegulator(torch.nn.Module, ABC):
     """
@@ -52,10 +50,12 @@ class LengthRegulator(torch.nn.Module, ABC):
         if ds.sum() == 0:
             ds[ds.sum(dim=1).eq(0)] = 1
 
-        return pad_list([self._repeat_one_sequence(x, d) for x, d in zip(xs, ds)], self.pad_value)
-
-    def _repeat_one_sequence(self, x, d):
-        """
-        Repeat each frame according to duration
-        """
-        return torch.repeat_interleave(x, d, dim=0)
+        # all sequences are repeated in one go, the repeated frames are then written into the preallocated padded output,
+        # rather than repeating every sequence on its own and copying the resulting list into a padded tensor afterwards
+        frames_per_sequence = ds.sum(dim=1)
+        repeated = torch.repeat_interleave(xs.reshape(-1, *xs.shape[2:]), ds.reshape(-1), dim=0)
+        if xs.size(0) == 1:
+            return repeated.unsqueeze(0)
+        upsampled = xs.new_full((xs.size(0), int(frames_per_sequence.max()), *xs.shape[2:]), self.pad_value)
+        upsampled[torch.arange(upsampled.size(1), device=ds.device).unsqueeze(0) < frames_per_sequence.unsqueeze(1)] = repeated
+        return upsampled
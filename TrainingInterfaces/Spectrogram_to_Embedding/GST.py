@@ -241,3 +241,32 @@ class MultiHeadedAttention(BaseMultiHeadedAttention):
         self.linear_out = torch.nn.Linear(n_feat, n_feat)
         self.attn = None
         self.dropout = torch.nn.Dropout(p=dropout_rate)
+
+    def forward_qkv(self, query, key, value):
+        """
+        Transform query, key and value with the three separate projections,
+        since their input dimensions differ and they can't be stacked.
+
+        Args:
+            query (torch.Tensor): Query tensor (#batch, time1, q_dim).
+            key (torch.Tensor): Key tensor (#batch, time2, k_dim).
+            value (torch.Tensor): Value tensor (#batch, time2, v_dim).
+
+        Returns:
+            torch.Tensor: Transformed query tensor (#batch, n_head, time1, d_k).
+            torch.Tensor: Transformed key tensor (#batch, n_head, time2, d_k).
+            torch.Tensor: Transformed value tensor (#batch, n_head, time2, d_k).
+        """
+        n_batch = query.size(0)
+        q = self.linear_q(query).view(n_batch, -1, self.h, self.d_k)
+        k = self.linear_k(key).view(n_batch, -1, self.h, self.d_k)
+        v = self.linear_v(value).view(n_batch, -1, self.h, self.d_k)
+        q = q.transpose(1, 2)  # (batch, head, time1, d_k)
+        k = k.transpose(1, 2)  # (batch, head, time2, d_k)
+        v = v.transpose(1, 2)  # (batch, head, time2, d_k)
+
+        return q, k, v
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # the projections are stored separately here, so the base class must not stack them while loading
+        torch.nn.Module._load_from_state_dict(self, state_dict, prefix, *args, **kwargs)
@@ -99,12 +99,12 @@ class HiFiGANDataset(Dataset):
         try:
             melspec = self.melspec_ap.audio_to_mel_spec_tensor(resampled_segment.float(),
                                                                explicit_sampling_rate=16000,
-                                                               normalize=False).transpose(0, 1)[:-1].transpose(0, 1)
+                                                               normalize=False)[:, :-1]  # drop the last frame
         except librosa.util.exceptions.ParameterError:
             # seems like sometimes adding noise and then resampling can introduce overflows which cause errors.
             melspec = self.melspec_ap.audio_to_mel_spec_tensor(self.melspec_ap.resample(segment).float(),
                                                                explicit_sampling_rate=16000,
-                                                               normalize=False).transpose(0, 1)[:-1].transpose(0, 1)
+                                                               normalize=False)[:, :-1]  # drop the last frame
         return segment, melspec
 
     def __len__(self):
@@ -12,6 +12,7 @@ from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.AdversarialLosses import Dis
 from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.AdversarialLosses import GeneratorAdversarialLoss
 from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.FeatureMatchingLoss import FeatureMatchLoss
 from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.MelSpectrogramLoss import MelSpectrogramLoss
+from Utility.CUDAPrefetcher import CUDAPrefetcher
 from Utility.utils import delete_old_checkpoints
 from Utility.utils import get_most_recent_checkpoint
 
@@ -88,15 +89,15 @@ def train_loop(generator,
 
         optimizer_g.zero_grad()
         optimizer_d.zero_grad()
-        for datapoint in tqdm(train_loader):
+        for datapoint in tqdm(CUDAPrefetcher(train_loader, device)):
             step_counter += 1
 
             ############################
             #         Generator        #
             ############################
 
-            gold_wave = datapoint[0].to(device).unsqueeze(1)
-            melspec = datapoint[1].to(device)
+            gold_wave = datapoint[0].unsqueeze(1)  # the prefetcher already moved the batch to the device
+            melspec = datapoint[1]
             pred_wave, intermediate_wave_upsampled_twice, intermediate_wave_upsampled_once = g(melspec)
 
             mel_loss = mel_l1(pred_wave.squeeze(1), gold_wave)
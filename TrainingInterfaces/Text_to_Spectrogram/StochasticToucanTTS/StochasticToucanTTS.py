@@ -95,6 +95,9 @@ class StochasticToucanTTS(torch.nn.Module):
         self.use_scaled_pos_enc = use_scaled_positional_encoding
         self.multilingual_model = lang_embs is not None
         self.multispeaker_model = utt_embed_dim is not None
+        feature_to_index = get_feature_to_index_lookup()
+        self._voiced_idx = feature_to_index["voiced"]
+        self._word_boundary_idx = feature_to_index["word-boundary"]
 
         articulatory_feature_embedding = Sequential(Linear(input_feature_dimensions, 100), Tanh(), Linear(100, attention_dimension))
         self.encoder = Conformer(idim=input_feature_dimensions,
@@ -283,9 +286,7 @@ class StochasticToucanTTS(torch.nn.Module):
 
             # predicting pitch
             pitch_predictions = self.pitch_flow(encoded_texts.transpose(1, 2), variance_mask, w=None, g=utterance_embedding.unsqueeze(-1), reverse=True).squeeze(-1).transpose(1, 2)
-            for phoneme_index, phoneme_vector in enumerate(text_tensors.squeeze(0)):
-                if phoneme_vector[get_feature_to_index_lookup()["voiced"]] == 0:
-                    pitch_predictions[0][phoneme_index] = 0.0
+            pitch_predictions = pitch_predictions.masked_fill((text_tensors[:, :, self._voiced_idx] == 0).unsqueeze(-1), 0.0)
             embedded_pitch_curve = self.pitch_embed(pitch_predictions.transpose(1, 2)).transpose(1, 2)
             encoded_texts = encoded_texts + embedded_pitch_curve
 
@@ -297,9 +298,7 @@ class StochasticToucanTTS(torch.nn.Module):
             # predicting durations
             predicted_durations = self.duration_flow(encoded_texts.transpose(1, 2), variance_mask, w=None, g=utterance_embedding.unsqueeze(-1), reverse=True).squeeze(-1).transpose(1, 2).squeeze(-1)
             predicted_durations = torch.ceil(torch.exp(predicted_durations)).long()
-            for phoneme_index, phoneme_vector in enumerate(text_tensors.squeeze(0)):
-                if phoneme_vector[get_feature_to_index_lookup()["word-boundary"]] == 1:
-                    predicted_durations[0][phoneme_index] = 0
+            predicted_durations = predicted_durations.masked_fill(text_tensors[:, :, self._word_boundary_idx] == 1, 0)
 
             # predicting durations for text and upsampling accordingly
             upsampled_enriched_encoded_texts = self.length_regulator(encoded_texts, predicted_durations)
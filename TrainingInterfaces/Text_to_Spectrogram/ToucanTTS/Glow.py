@@ -103,7 +103,11 @@ class InvConvNear(nn.Module):
         x = x.permute(0, 1, 3, 2, 4).contiguous().view(b, self.n_split, c // self.n_split, t)
 
         if self.lu:
-            self.weight, log_s = self._get_weight()
+            if reverse and hasattr(self, "weight_inv"):
+                # the inverse is already stored, so there is no need to rebuild the weight from its LU decomposition
+                log_s = self.log_s
+            else:
+                self.weight, log_s = self._get_weight()
             logdet = log_s.sum()
             logdet = logdet * (c / self.n_split) * x_len
         else:
@@ -111,6 +115,9 @@ class InvConvNear(nn.Module):
 
         if reverse:
             if hasattr(self, "weight_inv"):
+                if self.weight_inv.device != x.device:
+                    # the stored inverse is not a buffer, so it does not follow the module to another device by itself
+                    self.weight_inv = self.weight_inv.to(x.device)
                 weight = self.weight_inv
             else:
                 weight = torch.inverse(self.weight.float()).to(dtype=self.weight.dtype)
@@ -351,7 +358,7 @@ class Glow(nn.Module):
             y_lengths = tgt_nonpadding.sum(-1)
             tgt_mels = tgt_mels.transpose(1, 2)
             z_postflow, ldj = self._forward(tgt_mels, tgt_nonpadding, g=g)
-            ldj = ldj / y_lengths / 80
+            ldj = ldj / (y_lengths * self.in_channels)  # normalized per frame and per channel, the number of channels isn't necessarily 80
             try:
                 postflow_loss = -prior_dist.log_prob(z_postflow).mean() - ldj.mean()
             except ValueError:
@@ -360,7 +367,7 @@ class Glow(nn.Module):
             return postflow_loss
         else:
             nonpadding = torch.ones_like(x_recon[:, :1, :]) if tgt_nonpadding is None else tgt_nonpadding
-            z_post = torch.randn(x_recon.shape).to(g.device) * 0.8
+            z_post = torch.randn(x_recon.shape, device=g.device, dtype=x_recon.dtype) * 0.8  # sampled on the device directly, instead of on the CPU and then copied
             x_recon, _ = self._forward(z_post, nonpadding, g, reverse=True)
             return x_recon.transpose(1, 2)
 
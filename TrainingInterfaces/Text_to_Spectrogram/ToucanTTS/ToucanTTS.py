@@ -4,6 +4,7 @@ from torch.nn import Sequential
 from torch.nn import Tanh
 
 from Layers.Conformer import Conformer
+from Layers.CurveEmbedding import enrich_with_curves
 from Layers.DurationPredictor import DurationPredictor
 from Layers.LengthRegulator import LengthRegulator
 from Layers.PostNet import PostNet
@@ -105,6 +106,9 @@ class ToucanTTS(torch.nn.Module):
         self.use_scaled_pos_enc = use_scaled_positional_encoding
         self.multilingual_model = lang_embs is not None
         self.multispeaker_model = utt_embed_dim is not None
+        feature_to_index = get_feature_to_index_lookup()
+        self._voiced_idx = feature_to_index["voiced"]
+        self._word_boundary_idx = feature_to_index["word-boundary"]
 
         articulatory_feature_embedding = Sequential(Linear(input_feature_dimensions, 100), Tanh(), Linear(100, attention_dimension))
         self.encoder = Conformer(idim=input_feature_dimensions,
@@ -251,19 +255,20 @@ class ToucanTTS(torch.nn.Module):
                                   lang_ids=lang_ids,
                                   run_glow=run_glow)
 
-        # calculate loss
-        l1_loss, duration_loss, pitch_loss, energy_loss = self.criterion(after_outs=after_outs,
-                                                                         # if a regular PostNet is used, the post-PostNet outs have to go here. The flow has its own loss though, so we hard-code this to None
-                                                                         before_outs=before_outs,
-                                                                         gold_spectrograms=gold_speech,
-                                                                         spectrogram_lengths=speech_lengths,
-                                                                         text_lengths=text_lengths,
-                                                                         gold_durations=gold_durations,
-                                                                         predicted_durations=predicted_durations,
-                                                                         predicted_pitch=predicted_pitch,
-                                                                         predicted_energy=predicted_energy,
-                                                                         gold_pitch=gold_pitch,
-                                                                         gold_energy=gold_energy)
+        # calculate loss (the reductions are done in full precision, even if the forward pass ran under autocast)
+        with torch.autocast(device_type=before_outs.device.type, enabled=False):
+            l1_loss, duration_loss, pitch_loss, energy_loss = self.criterion(after_outs=after_outs.float(),
+                                                                             # if a regular PostNet is used, the post-PostNet outs have to go here. The flow has its own loss though, so we hard-code this to None
+                                                                             before_outs=before_outs.float(),
+                                                                             gold_spectrograms=gold_speech,
+                                                                             spectrogram_lengths=speech_lengths,
+                                                                             text_lengths=text_lengths,
+                                                                             gold_durations=gold_durations,
+                                                                             predicted_durations=predicted_durations.float(),
+                                                                             predicted_pitch=predicted_pitch.float(),
+                                                                             predicted_energy=predicted_energy.float(),
+                                                                             gold_pitch=gold_pitch.float(),  # the targets may be stored in a reduced precision
+                                                                             gold_energy=gold_energy.float())
 
         if return_mels:
             if after_outs is None:
@@ -284,18 +289,16 @@ class ToucanTTS(torch.nn.Module):
                  lang_ids=None,
                  run_glow=True):
 
-        if not self.multilingual_model:
-            lang_ids = None
-
-        if not self.multispeaker_model:
-            utterance_embedding = None
-        else:
-            utterance_embedding = torch.nn.functional.normalize(utterance_embedding)
+        utterance_embedding, lang_ids = self._prepare_conditioning(utterance_embedding, lang_ids)
 
         # encoding the texts
-        text_masks = make_non_pad_mask(text_lengths, device=text_lengths.device).unsqueeze(-2)
-        padding_masks = make_pad_mask(text_lengths, device=text_lengths.device)
-        encoded_texts, _ = self.encoder(text_tensors, text_masks, utterance_embedding=utterance_embedding, lang_ids=lang_ids)
+        padding_masks = make_pad_mask(text_lengths, xs=text_tensors[:, :, 0], device=text_lengths.device)  # sized like the texts, which may be padded beyond the longest one
+        text_masks = ~padding_masks.unsqueeze(-2)  # the non-padding mask is just the inverse, no need to build it from the lengths again
+        encoded_texts, _ = self.encoder(text_tensors,
+                                        text_masks,
+                                        utterance_embedding=utterance_embedding,
+                                        lang_ids=lang_ids,
+                                        utterance_embedding_is_normalized=True)  # normalized in _prepare_conditioning, it is shared with the variance predictors
 
         if is_inference:
             # predicting pitch, energy and durations
@@ -303,16 +306,11 @@ class ToucanTTS(torch.nn.Module):
             energy_predictions = self.energy_predictor(encoded_texts, padding_mask=None, utt_embed=utterance_embedding)
             predicted_durations = self.duration_predictor.inference(encoded_texts, padding_mask=None, utt_embed=utterance_embedding)
 
-            # modifying the predictions with linguistic knowledge
-            for phoneme_index, phoneme_vector in enumerate(text_tensors.squeeze(0)):
-                if phoneme_vector[get_feature_to_index_lookup()["voiced"]] == 0:
-                    pitch_predictions[0][phoneme_index] = 0.0
-                if phoneme_vector[get_feature_to_index_lookup()["word-boundary"]] == 1:
-                    predicted_durations[0][phoneme_index] = 0
+            # modifying the predictions with linguistic knowledge (as masks over the whole sequence, so there is no device synchronization per phoneme)
+            pitch_predictions = pitch_predictions.masked_fill((text_tensors[:, :, self._voiced_idx] == 0).unsqueeze(-1), 0.0)
+            predicted_durations = predicted_durations.masked_fill(text_tensors[:, :, self._word_boundary_idx] == 1, 0)
             # enriching the text with pitch and energy info
-            embedded_pitch_curve = self.pitch_embed(pitch_predictions.transpose(1, 2)).transpose(1, 2)
-            embedded_energy_curve = self.energy_embed(energy_predictions.transpose(1, 2)).transpose(1, 2)
-            enriched_encoded_texts = encoded_texts + embedded_pitch_curve + embedded_energy_curve
+            enriched_encoded_texts = enrich_with_curves(encoded_texts, self.pitch_embed, self.energy_embed, pitch_predictions, energy_predictions)
 
             # predicting durations for text and upsampling accordingly
             upsampled_enriched_encoded_texts = self.length_regulator(enriched_encoded_texts, predicted_durations)
@@ -321,11 +319,13 @@ class ToucanTTS(torch.nn.Module):
             # training with teacher forcing
             pitch_predictions = self.pitch_predictor(encoded_texts.detach(), padding_mask=padding_masks.unsqueeze(-1), utt_embed=utterance_embedding)
             energy_predictions = self.energy_predictor(encoded_texts, padding_mask=padding_masks.unsqueeze(-1), utt_embed=utterance_embedding)
-            predicted_durations = self.duration_predictor(encoded_texts, padding_mask=padding_masks, utt_embed=utterance_embedding)
+            with torch.autocast(device_type=encoded_texts.device.type, enabled=False):
+                # the log-durations are sensitive to the reduced precision under mixed precision training, so this predictor always runs in full precision
+                predicted_durations = self.duration_predictor(encoded_texts.float(),
+                                                              padding_mask=padding_masks,
+                                                              utt_embed=utterance_embedding.float() if utterance_embedding is not None else None)
 
-            embedded_pitch_curve = self.pitch_embed(gold_pitch.transpose(1, 2)).transpose(1, 2)
-            embedded_energy_curve = self.energy_embed(gold_energy.transpose(1, 2)).transpose(1, 2)
-            enriched_encoded_texts = encoded_texts + embedded_energy_curve + embedded_pitch_curve
+            enriched_encoded_texts = enrich_with_curves(encoded_texts, self.pitch_embed, self.energy_embed, gold_pitch, gold_energy)
 
             upsampled_enriched_encoded_texts = self.length_regulator(enriched_encoded_texts, gold_durations)
 
@@ -337,20 +337,22 @@ class ToucanTTS(torch.nn.Module):
         refined_spectrogram = decoded_spectrogram + self.conv_postnet(decoded_spectrogram.transpose(1, 2)).transpose(1, 2)
 
         # refine spectrogram further with a normalizing flow (requires warmup, so it's not always on)
+        # (the invertible flow and its log-determinant are always computed in full precision)
         glow_loss = None
         if run_glow:
-            if is_inference:
-                refined_spectrogram = self.post_flow(tgt_mels=None,
-                                                     infer=is_inference,
-                                                     mel_out=refined_spectrogram,
-                                                     encoded_texts=upsampled_enriched_encoded_texts,
-                                                     tgt_nonpadding=None).squeeze()
-            else:
-                glow_loss = self.post_flow(tgt_mels=gold_speech,
-                                           infer=is_inference,
-                                           mel_out=refined_spectrogram.detach().clone(),
-                                           encoded_texts=upsampled_enriched_encoded_texts.detach().clone(),
-                                           tgt_nonpadding=decoder_masks)
+            with torch.autocast(device_type=refined_spectrogram.device.type, enabled=False):
+                if is_inference:
+                    refined_spectrogram = self.post_flow(tgt_mels=None,
+                                                         infer=is_inference,
+                                                         mel_out=refined_spectrogram.float(),
+                                                         encoded_texts=upsampled_enriched_encoded_texts.float(),
+                                                         tgt_nonpadding=None).squeeze()
+                else:
+                    glow_loss = self.post_flow(tgt_mels=gold_speech.float(),
+                                               infer=is_inference,
+                                               mel_out=refined_spectrogram.detach().float(),  # the flow does not modify its inputs in place, so no copies are needed
+                                               encoded_texts=upsampled_enriched_encoded_texts.detach().float(),
+                                               tgt_nonpadding=decoder_masks)
         if is_inference:
             return decoded_spectrogram.squeeze(), \
                    refined_spectrogram.squeeze(), \
@@ -382,7 +384,9 @@ class ToucanTTS(torch.nn.Module):
             lang_id (LongTensor): The language ID used to access the language embedding table, if the model is multilingual
             utterance_embedding (Tensor): Embedding to condition the TTS on, if the model is multispeaker
         """
-        self.eval()
+        was_training = self.training
+        if was_training:
+            self.eval()  # switching the mode walks through all submodules, so it is only done if it is actually needed
         x, y = text, speech
 
         # setup batch axis
@@ -405,13 +409,24 @@ class ToucanTTS(torch.nn.Module):
                                            utterance_embedding=utterance_embeddings,
                                            lang_ids=lang_id,
                                            run_glow=run_postflow)  # (1, L, odim)
-        self.train()
+        if was_training:
+            self.train()
         if after_outs is None:
             after_outs = before_outs
         if return_duration_pitch_energy:
             return before_outs, after_outs, duration_predictions, pitch_predictions, energy_predictions
         return after_outs
 
+    def _prepare_conditioning(self, utterance_embedding, lang_ids):
+        if not self.multilingual_model:
+            lang_ids = None
+
+        if not self.multispeaker_model:
+            utterance_embedding = None
+        else:
+            utterance_embedding = torch.nn.functional.normalize(utterance_embedding)
+        return utterance_embedding, lang_ids
+
     def _reset_parameters(self, init_type):
         # initialize parameters
         if init_type != "pytorch":
@@ -50,7 +50,7 @@ class ToucanTTSLoss(torch.nn.Module):
         out_masks = torch.nn.functional.pad(out_masks.transpose(1, 2), [0, gold_spectrograms.size(1) - out_masks.size(1), 0, 0, 0, 0], value=False).transpose(1, 2)
         out_weights = out_masks.float() / out_masks.sum(dim=1, keepdim=True).float()
         out_weights /= gold_spectrograms.size(0) * gold_spectrograms.size(2)
-        duration_masks = make_non_pad_mask(text_lengths).to(gold_spectrograms.device)
+        duration_masks = make_non_pad_mask(text_lengths, xs=gold_durations).to(gold_spectrograms.device)  # the texts may be padded beyond the longest one
         duration_weights = (duration_masks.float() / duration_masks.sum(dim=1, keepdim=True).float())
         variance_masks = duration_masks.unsqueeze(-1)
         variance_weights = duration_weights.unsqueeze(-1)
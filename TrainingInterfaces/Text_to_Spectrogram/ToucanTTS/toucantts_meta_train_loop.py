@@ -1,13 +1,18 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import torch
 import torch.multiprocessing
 import wandb
 from torch.cuda.amp import GradScaler
 from torch.cuda.amp import autocast
-from torch.nn.utils.rnn import pad_sequence
+from torch.utils.data import ConcatDataset
+from torch.utils.data import Sampler
 from torch.utils.data.dataloader import DataLoader
 from tqdm import tqdm
 
 from TrainingInterfaces.Spectrogram_to_Embedding.StyleEmbedding import StyleEmbedding
+from Utility.CUDAPrefetcher import CUDAPrefetcher
 from Utility.WarmupScheduler import ToucanWarmupScheduler as WarmupScheduler
 from Utility.path_to_transcript_dicts import *
 from Utility.utils import delete_old_checkpoints
@@ -19,19 +24,86 @@ from run_weight_averaging import load_net_toucan
 from run_weight_averaging import save_model_for_use
 
 
+# stores the pitch and energy targets in bfloat16, which halves their size on the way to the GPU. bfloat16 has the range of
+# float32, so the targets need no scaling, but their precision is reduced. Only meant for training on CUDA under autocast.
+BFLOAT16_PROSODY = os.environ.get("TOUCAN_BF16_PROSODY", "0") == "1"
+
+
 def collate_and_pad(batch):
     # text, text_len, speech, speech_len, durations, energy, pitch, utterance condition, language_id
-    return (pad_sequence([datapoint[0].squeeze() for datapoint in batch], batch_first=True),
+    # everything that is aligned with the text is padded to a multiple of 8 phonemes, so the matmuls of the encoder get shapes
+    # that tensor cores can work with. The lengths stay the same, so the extra padding is masked like any other padding.
+    # The speech is not padded further, its length has to match the sum of the durations.
+    return (pad_to_multiple([datapoint[0].squeeze() for datapoint in batch], multiple=8),
             torch.stack([datapoint[1] for datapoint in batch]),
-            pad_sequence([datapoint[2].squeeze() for datapoint in batch], batch_first=True),
+            pad_to_multiple([datapoint[2].squeeze() for datapoint in batch]),
             torch.stack([datapoint[3] for datapoint in batch]),
-            pad_sequence([datapoint[4].squeeze() for datapoint in batch], batch_first=True),
-            pad_sequence([datapoint[5].squeeze() for datapoint in batch], batch_first=True),
-            pad_sequence([datapoint[6].squeeze() for datapoint in batch], batch_first=True),
+            pad_to_multiple([datapoint[4].squeeze() for datapoint in batch], multiple=8),
+            pad_to_multiple([datapoint[5].squeeze() for datapoint in batch], multiple=8, dtype=torch.bfloat16 if BFLOAT16_PROSODY else None),
+            pad_to_multiple([datapoint[6].squeeze() for datapoint in batch], multiple=8, dtype=torch.bfloat16 if BFLOAT16_PROSODY else None),
             None,
             torch.stack([datapoint[8] for datapoint in batch]))
 
 
+def pad_to_multiple(sequences, multiple=1, dtype=None):
+    # the padded batch is allocated once, already with its final length and dtype, and every sequence is copied into its slot
+    max_length = max(sequence.size(0) for sequence in sequences)
+    max_length = max_length + (-max_length) % multiple
+    padded = sequences[0].new_zeros((len(sequences), max_length, *sequences[0].shape[1:]), dtype=dtype)
+    for index, sequence in enumerate(sequences):
+        padded[index, :sequence.size(0)] = sequence
+    return padded
+
+
+class RoundRobinBatchSampler(Sampler):
+    """
+    Draws batches of indexes into a ConcatDataset of the datasets of all tasks (i.e. languages in this case),
+    taking one sample from each task in an order that is randomized once per batch until the batch is full. Every task is shuffled
+    on its own and starts over once it is exhausted, so the batches never run out.
+    """
+
+    def __init__(self, dataset_lengths, batch_size):
+        self.dataset_lengths = dataset_lengths
+        self.batch_size = batch_size
+        self.offsets = [sum(dataset_lengths[:index]) for index in range(len(dataset_lengths))]
+
+    def __iter__(self):
+        # seeded from the random module, so that seeding it still makes the batches reproducible
+        self.rng = np.random.default_rng(random.getrandbits(32))
+        num_tasks = len(self.dataset_lengths)
+        orders = [self._shuffled(index) for index in range(num_tasks)]
+        while True:
+            batch = []
+            task_order = self.rng.permutation(num_tasks).tolist()
+            position = 0
+            while len(batch) < self.batch_size:
+                index = task_order[position % num_tasks]
+                if len(orders[index]) == 0:
+                    orders[index] = self._shuffled(index)
+                batch.append(orders[index].pop())
+                position += 1
+            yield batch
+
+    def _shuffled(self, index):
+        return (self.offsets[index] + self.rng.permutation(self.dataset_lengths[index])).tolist()
+
+
+def checkpoint_to_cpu(checkpoint):
+    # a copy of every tensor, so the training can keep updating the originals in place while the copy is written to disk
+    if isinstance(checkpoint, torch.Tensor):
+        return checkpoint.detach().to("cpu", copy=True)
+    if isinstance(checkpoint, dict):
+        return {key: checkpoint_to_cpu(value) for key, value in checkpoint.items()}
+    if isinstance(checkpoint, (list, tuple)):
+        return type(checkpoint)(checkpoint_to_cpu(value) for value in checkpoint)
+    return checkpoint
+
+
+def save_checkpoint(checkpoint, path, save_directory):
+    torch.save(checkpoint, path)
+    delete_old_checkpoints(save_directory, keep=5)
+
+
 def train_loop(net,
                datasets,
                device,
@@ -64,29 +136,32 @@ def train_loop(net,
     style_embedding_function.load_state_dict(check_dict["style_emb_func"])
     style_embedding_function.eval()
     style_embedding_function.requires_grad_(False)
+    training_net = net
+    if os.environ.get("TOUCAN_COMPILE", "0") == "1":
+        # fuses the many small operations of the TTS, including the post-flow. The compiled wrapper is only used for the training steps,
+        # the module itself stays untouched, so it can still be saved, averaged and copied. The shapes of the TTS change from batch to batch,
+        # so they are compiled as dynamic to avoid recompiling for every new length. The spectrograms are always cut to the same length
+        # before they reach the GST, so only the batch axis varies there and the shapes can be specialized.
+        training_net = torch.compile(net, dynamic=True)
+        style_embedding_function.gst = torch.compile(style_embedding_function.gst)
 
     torch.multiprocessing.set_sharing_strategy('file_system')
-    train_loaders = list()
-    train_iters = list()
-    for dataset in datasets:
-        train_loaders.append(DataLoader(batch_size=1,
-                                        dataset=dataset,
-                                        drop_last=True,
-                                        num_workers=2,
-                                        pin_memory=True,
-                                        shuffle=True,
-                                        prefetch_factor=4,
-                                        collate_fn=collate_and_pad,
-                                        persistent_workers=True))
-        train_iters.append(iter(train_loaders[-1]))
-    optimizer = torch.optim.Adam(net.parameters(), lr=lr)
+    # one loader for all tasks, so the samples are collated only once and the workers hand out whole batches instead of single samples
+    train_loader = DataLoader(dataset=ConcatDataset(datasets),
+                              batch_sampler=RoundRobinBatchSampler([len(dataset) for dataset in datasets], batch_size),
+                              # every worker holds prefetch_factor complete pinned batches, so both are kept small to bound the host memory
+                              num_workers=min(8, os.cpu_count() if os.cpu_count() is not None else 1),
+                              pin_memory=True,
+                              prefetch_factor=2,
+                              collate_fn=collate_and_pad,
+                              persistent_workers=True)
+    train_iter = iter(CUDAPrefetcher(train_loader, device))  # copies the next batch to the GPU on a side stream while the current one is trained on
+    optimizer = torch.optim.Adam(net.parameters(), lr=lr, fused=device.type == "cuda")  # the fused kernel updates all parameters at once instead of one after the other
     scheduler = WarmupScheduler(optimizer, peak_lr=lr, warmup_steps=warmup_steps, max_steps=steps)
-    grad_scaler = GradScaler()
+    grad_scaler = GradScaler(enabled=device.type == "cuda")
     steps_run_previously = 0
-    l1_losses_total = list()
-    duration_losses_total = list()
-    pitch_losses_total = list()
-    energy_losses_total = list()
+    # the losses are collected as tensors on the device and only read out when they are reported, so logging them doesn't synchronize every step
+    losses_total = list()  # l1, duration, pitch and energy loss of each step
     glow_losses_total = list()
 
     if resume:
@@ -103,42 +178,34 @@ def train_loop(net,
             print("Desired steps already reached in loaded checkpoint.")
             return
 
+    checkpoint_saver = ThreadPoolExecutor(max_workers=1)  # writes the checkpoints in the background, one at a time
+    pending_save = None
     net.train()
+    trainable_parameters = [parameter for parameter in net.parameters() if parameter.requires_grad]  # collected once, instead of walking the modules for every clipping
     # =============================
     # Actual train loop starts here
     # =============================
-    for step_counter in tqdm(range(steps_run_previously, steps)):
-        batches = []
-        while len(batches) < batch_size:
-            for index in random.sample(list(range(len(datasets))), len(datasets)):
-                if len(batches) < batch_size:
-                    # we get one batch for each task (i.e. language in this case) in a randomized order
-                    try:
-                        batch = next(train_iters[index])
-                        batches.append(batch)
-                    except StopIteration:
-                        train_iters[index] = iter(train_loaders[index])
-                        batch = next(train_iters[index])
-                        batches.append(batch)
-        batch = collate_and_pad(batches)
-
-        text_tensors = batch[0].to(device)
-        text_lengths = batch[1].squeeze().to(device)
-        gold_speech = batch[2].to(device)
-        speech_lengths = batch[3].squeeze().to(device)
-        gold_durations = batch[4].to(device)
-        gold_pitch = batch[6].unsqueeze(-1).to(device)  # mind the switched order
-        gold_energy = batch[5].unsqueeze(-1).to(device)  # mind the switched order
-        lang_ids = batch[8].squeeze(1).to(device)
-
-        train_loss = 0.0
-        with autocast():
+    for step_counter in tqdm(range(steps_run_previously, steps), mininterval=5.0, smoothing=0.0):  # redrawing the bar every step costs more than it tells
+        batch = next(train_iter)  # the sampler never runs out, it starts over with every task that is exhausted
+
+        # the prefetcher already moved the batch to the device
+        text_tensors = batch[0]
+        text_lengths = batch[1].squeeze()
+        gold_speech = batch[2]
+        speech_lengths = batch[3].squeeze()
+        gold_durations = batch[4]
+        gold_pitch = batch[6].unsqueeze(-1)  # mind the switched order
+        gold_energy = batch[5].unsqueeze(-1)  # mind the switched order
+        lang_ids = batch[8]  # (B, 1), the language embedding is broadcast over the sequence
+
+        with autocast(enabled=device.type == "cuda"):
             # we sum the loss for each task, as we would do for the
             # second order regular MAML, but we do it only over one
             # step (i.e. iterations of inner loop = 1)
-            style_embedding = style_embedding_function(batch_of_spectrograms=batch[2].to(device),
-                                                       batch_of_spectrogram_lengths=batch[3].to(device))
-            l1_loss, duration_loss, pitch_loss, energy_loss, glow_loss = net(
+            with torch.no_grad():  # the style embedding is frozen, it only provides the conditioning
+                style_embedding = style_embedding_function(batch_of_spectrograms=gold_speech,  # the spectrograms are already on the device, no need to copy them a second time
+                                                           batch_of_spectrogram_lengths=speech_lengths)
+            l1_loss, duration_loss, pitch_loss, energy_loss, glow_loss = training_net(
                 text_tensors=text_tensors,
                 text_lengths=text_lengths,
                 gold_speech=gold_speech,
@@ -154,28 +221,21 @@ def train_loop(net,
             # then we directly update our meta-parameters without
             # the need for any task specific parameters
 
-            if not torch.isnan(l1_loss):
-                train_loss = train_loss + l1_loss
-            if not torch.isnan(duration_loss):
-                train_loss = train_loss + duration_loss
-            if not torch.isnan(pitch_loss):
-                train_loss = train_loss + pitch_loss
-            if not torch.isnan(energy_loss):
-                train_loss = train_loss + energy_loss
-            if glow_loss is not None:
-                if step_counter > postnet_start_steps and not torch.isnan(glow_loss):
-                    train_loss = train_loss + glow_loss
-                    glow_losses_total.append(glow_loss.item())
-
-        l1_losses_total.append(l1_loss.item())
-        duration_losses_total.append(duration_loss.item())
-        pitch_losses_total.append(pitch_loss.item())
-        energy_losses_total.append(energy_loss.item())
-
-        optimizer.zero_grad()
+            # losses that are nan are left out by summing with nansum on the device, checking them on the host would wait for the GPU.
+            # Anything else that is not finite ends up in the gradients, where the grad scaler catches it and skips the step.
+            step_losses = torch.stack([l1_loss, duration_loss, pitch_loss, energy_loss])
+            if glow_loss is not None and step_counter > postnet_start_steps:
+                train_loss = torch.nansum(torch.cat([step_losses, glow_loss.reshape(1)]))
+                glow_losses_total.append(glow_loss.detach())
+            else:
+                train_loss = torch.nansum(step_losses)
+
+        losses_total.append(step_losses.detach())
+
+        optimizer.zero_grad(set_to_none=True)
         grad_scaler.scale(train_loss).backward()
         grad_scaler.unscale_(optimizer)
-        torch.nn.utils.clip_grad_norm_(net.parameters(), 1.0, error_if_nonfinite=False)
+        torch.nn.utils.clip_grad_norm_(trainable_parameters, 1.0, error_if_nonfinite=False)
         grad_scaler.step(optimizer)
         grad_scaler.update()
         scheduler.step()
@@ -186,29 +246,35 @@ def train_loop(net,
             # ==============================
             net.eval()
             style_embedding_function.eval()
+            default_datapoint = datasets[0][0]  # indexing a (concat) dataset assembles the whole datapoint, so it is only done once
             default_embedding = style_embedding_function(
-                batch_of_spectrograms=datasets[0][0][2].unsqueeze(0).to(device),
-                batch_of_spectrogram_lengths=datasets[0][0][3].unsqueeze(0).to(device)).squeeze()
-            print("Reconstruction Loss:    {}".format(round(sum(l1_losses_total) / len(l1_losses_total), 3)))
+                batch_of_spectrograms=default_datapoint[2].unsqueeze(0).to(device),
+                batch_of_spectrogram_lengths=default_datapoint[3].unsqueeze(0).to(device)).squeeze()
+            l1_loss_mean, duration_loss_mean, pitch_loss_mean, energy_loss_mean = torch.stack(losses_total).mean(dim=0).tolist()
+            glow_loss_mean = torch.stack(glow_losses_total).nanmean().item() if len(glow_losses_total) != 0 else None  # nan steps were never counted for the flow
+            print("Reconstruction Loss:    {}".format(round(l1_loss_mean, 3)))
             print("Steps:                  {}\n".format(step_counter))
-            torch.save({
-                "model"       : net.state_dict(),
-                "optimizer"   : optimizer.state_dict(),
-                "scaler"      : grad_scaler.state_dict(),
-                "scheduler"   : scheduler.state_dict(),
-                "step_counter": step_counter,
-                "default_emb" : default_embedding,
-            },
-                os.path.join(save_directory, "checkpoint_{}.pt".format(step_counter)))
-            delete_old_checkpoints(save_directory, keep=5)
+            if pending_save is not None:
+                pending_save.result()  # there is only ever one checkpoint waiting to be written, so the copies don't pile up in memory
+            pending_save = checkpoint_saver.submit(save_checkpoint,
+                                                   checkpoint_to_cpu({
+                                                       "model"       : net.state_dict(),
+                                                       "optimizer"   : optimizer.state_dict(),
+                                                       "scaler"      : grad_scaler.state_dict(),
+                                                       "scheduler"   : scheduler.state_dict(),
+                                                       "step_counter": step_counter,
+                                                       "default_emb" : default_embedding,
+                                                   }),
+                                                   os.path.join(save_directory, "checkpoint_{}.pt".format(step_counter)),
+                                                   save_directory)
 
             if use_wandb:
                 wandb.log({
-                    "l1_loss"      : round(sum(l1_losses_total) / len(l1_losses_total), 5),
-                    "duration_loss": round(sum(duration_losses_total) / len(duration_losses_total), 5),
-                    "pitch_loss"   : round(sum(pitch_losses_total) / len(pitch_losses_total), 5),
-                    "energy_loss"  : round(sum(energy_losses_total) / len(energy_losses_total), 5),
-                    "glow_loss"    : round(sum(glow_losses_total) / len(glow_losses_total), 3) if len(glow_losses_total) != 0 else None,
+                    "l1_loss"      : round(l1_loss_mean, 5),
+                    "duration_loss": round(duration_loss_mean, 5),
+                    "pitch_loss"   : round(pitch_loss_mean, 5),
+                    "energy_loss"  : round(energy_loss_mean, 5),
+                    "glow_loss"    : round(glow_loss_mean, 3) if glow_loss_mean is not None else None,
                 }, step=step_counter)
 
             try:
@@ -231,18 +297,20 @@ def train_loop(net,
             except IndexError:
                 print("generating progress plots failed.")
 
-            l1_losses_total = list()
-            duration_losses_total = list()
-            pitch_losses_total = list()
-            energy_losses_total = list()
+            losses_total = list()
             glow_losses_total = list()
 
             if step_counter > 3 * postnet_start_steps:
                 # Run manual SWA (torch builtin doesn't work unfortunately due to the use of weight norm in the postflow)
+                pending_save.result()  # the averaging reads the most recent checkpoints back from disk
                 checkpoint_paths = get_n_recent_checkpoints_paths(checkpoint_dir=save_directory, n=2)
                 averaged_model, default_embed = average_checkpoints(checkpoint_paths, load_func=load_net_toucan)
-                save_model_for_use(model=averaged_model, default_embed=default_embed, name=os.path.join(save_directory, "best.pt"))
-                check_dict = torch.load(os.path.join(save_directory, "best.pt"), map_location=device)
-                net.load_state_dict(check_dict["model"])
+                net.load_state_dict(averaged_model.state_dict())  # taken from the averaged model directly, rather than reading back the file it is saved to
+                # the averaged model isn't touched again, so it can be written while the training continues. The executor works in order, so waiting for this also waits for the checkpoint before it.
+                pending_save = checkpoint_saver.submit(save_model_for_use, model=averaged_model, default_embed=default_embed, name=os.path.join(save_directory, "best.pt"))
 
             net.train()
+
+    if pending_save is not None:
+        pending_save.result()  # also raises anything that went wrong while writing the last checkpoint
+    checkpoint_saver.shutdown()
@@ -5,6 +5,8 @@ import time
 import torch
 import torch.multiprocessing
 import wandb
+from torch.cuda.amp import GradScaler
+from torch.cuda.amp import autocast
 from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data.dataloader import DataLoader
 from tqdm import tqdm
@@ -63,6 +65,14 @@ def train_loop(net,
     style_embedding_function.load_state_dict(check_dict["style_emb_func"])
     style_embedding_function.eval()
     style_embedding_function.requires_grad_(False)
+    training_net = net
+    if os.environ.get("TOUCAN_COMPILE", "0") == "1":
+        # fuses the many small operations of the TTS, including the post-flow. The compiled wrapper is only used for the training steps,
+        # the module itself stays untouched, so it can still be saved, averaged and copied. The shapes of the TTS change from batch to batch,
+        # so they are compiled as dynamic to avoid recompiling for every new length. The spectrograms are always cut to the same length
+        # before they reach the GST, so only the batch axis varies there and the shapes can be specialized.
+        training_net = torch.compile(net, dynamic=True)
+        style_embedding_function.gst = torch.compile(style_embedding_function.gst)
 
     torch.multiprocessing.set_sharing_strategy('file_system')
     train_loader = DataLoader(batch_size=batch_size,
@@ -75,11 +85,13 @@ def train_loop(net,
                               collate_fn=collate_and_pad,
                               persistent_workers=True)
     step_counter = 0
+    # the fused kernel updates all parameters at once instead of one after the other
     if use_discriminator:
-        optimizer = torch.optim.Adam(list(net.parameters()) + list(discriminator.parameters()), lr=lr)
+        optimizer = torch.optim.Adam(list(net.parameters()) + list(discriminator.parameters()), lr=lr, fused=device.type == "cuda")
     else:
-        optimizer = torch.optim.Adam(net.parameters(), lr=lr)
+        optimizer = torch.optim.Adam(net.parameters(), lr=lr, fused=device.type == "cuda")
     scheduler = WarmupScheduler(optimizer, peak_lr=lr, warmup_steps=warmup_steps, max_steps=steps)
+    grad_scaler = GradScaler(enabled=device.type == "cuda")
     epoch = 0
     if resume:
         path_to_checkpoint = get_most_recent_checkpoint(checkpoint_dir=save_directory)
@@ -90,6 +102,8 @@ def train_loop(net,
             optimizer.load_state_dict(check_dict["optimizer"])
             scheduler.load_state_dict(check_dict["scheduler"])
             step_counter = check_dict["step_counter"]
+            if "scaler" in check_dict:  # checkpoints from before mixed precision training don't have one
+                grad_scaler.load_state_dict(check_dict["scaler"])
     start_time = time.time()
     while True:
         net.train()
@@ -104,45 +118,47 @@ def train_loop(net,
 
         for batch in tqdm(train_loader):
             train_loss = 0.0
-            style_embedding = style_embedding_function(batch_of_spectrograms=batch[2].to(device),
-                                                       batch_of_spectrogram_lengths=batch[3].to(device))
+            with autocast(enabled=device.type == "cuda"):
+                with torch.no_grad():  # the style embedding is frozen, it only provides the conditioning
+                    style_embedding = style_embedding_function(batch_of_spectrograms=batch[2].to(device),
+                                                               batch_of_spectrogram_lengths=batch[3].to(device))
 
-            l1_loss, duration_loss, pitch_loss, energy_loss, glow_loss, generated_spectrograms = net(
-                text_tensors=batch[0].to(device),
-                text_lengths=batch[1].to(device),
-                gold_speech=batch[2].to(device),
-                speech_lengths=batch[3].to(device),
-                gold_durations=batch[4].to(device),
-                gold_pitch=batch[6].to(device),  # mind the switched order
-                gold_energy=batch[5].to(device),  # mind the switched order
-                utterance_embedding=style_embedding,
-                lang_ids=batch[8].to(device),
-                return_mels=True,
-                run_glow=step_counter > postnet_start_steps or fine_tune)
+                l1_loss, duration_loss, pitch_loss, energy_loss, glow_loss, generated_spectrograms = training_net(
+                    text_tensors=batch[0].to(device),
+                    text_lengths=batch[1].to(device),
+                    gold_speech=batch[2].to(device),
+                    speech_lengths=batch[3].to(device),
+                    gold_durations=batch[4].to(device),
+                    gold_pitch=batch[6].to(device),  # mind the switched order
+                    gold_energy=batch[5].to(device),  # mind the switched order
+                    utterance_embedding=style_embedding,
+                    lang_ids=batch[8].to(device),
+                    return_mels=True,
+                    run_glow=step_counter > postnet_start_steps or fine_tune)
 
-            if use_discriminator:
-                discriminator_loss, generator_loss = calc_gan_outputs(real_spectrograms=batch[2].to(device),
-                                                                      fake_spectrograms=generated_spectrograms,
-                                                                      spectrogram_lengths=batch[3].to(device),
-                                                                      discriminator=discriminator)
-                if not torch.isnan(discriminator_loss):
-                    train_loss = train_loss + discriminator_loss
-                if not torch.isnan(generator_loss):
-                    train_loss = train_loss + generator_loss
-                discriminator_losses_total.append(discriminator_loss.item())
-                generator_losses_total.append(generator_loss.item())
+                if use_discriminator:
+                    discriminator_loss, generator_loss = calc_gan_outputs(real_spectrograms=batch[2].to(device),
+                                                                          fake_spectrograms=generated_spectrograms,
+                                                                          spectrogram_lengths=batch[3].to(device),
+                                                                          discriminator=discriminator)
+                    if not torch.isnan(discriminator_loss):
+                        train_loss = train_loss + discriminator_loss
+                    if not torch.isnan(generator_loss):
+                        train_loss = train_loss + generator_loss
+                    discriminator_losses_total.append(discriminator_loss.item())
+                    generator_losses_total.append(generator_loss.item())
 
-            if not torch.isnan(l1_loss):
-                train_loss = train_loss + l1_loss
-            if not torch.isnan(duration_loss):
-                train_loss = train_loss + duration_loss
-            if not torch.isnan(pitch_loss):
-                train_loss = train_loss + pitch_loss
-            if not torch.isnan(energy_loss):
-                train_loss = train_loss + energy_loss
-            if glow_loss is not None:
-                if step_counter > postnet_start_steps and not torch.isnan(glow_loss):
-                    train_loss = train_loss + glow_loss
+                if not torch.isnan(l1_loss):
+                    train_loss = train_loss + l1_loss
+                if not torch.isnan(duration_loss):
+                    train_loss = train_loss + duration_loss
+                if not torch.isnan(pitch_loss):
+                    train_loss = train_loss + pitch_loss
+                if not torch.isnan(energy_loss):
+                    train_loss = train_loss + energy_loss
+                if glow_loss is not None:
+                    if step_counter > postnet_start_steps and not torch.isnan(glow_loss):
+                        train_loss = train_loss + glow_loss
 
             l1_losses_total.append(l1_loss.item())
             duration_losses_total.append(duration_loss.item())
@@ -152,10 +168,12 @@ def train_loop(net,
                 # start logging late so the magnitude difference is smaller
                 glow_losses_total.append(glow_loss.item())
 
-            optimizer.zero_grad()
-            train_loss.backward()
+            optimizer.zero_grad(set_to_none=True)
+            grad_scaler.scale(train_loss).backward()
+            grad_scaler.unscale_(optimizer)  # the gradients have to be unscaled before they are clipped
             torch.nn.utils.clip_grad_norm_(net.parameters(), 1.0, error_if_nonfinite=False)
-            optimizer.step()
+            grad_scaler.step(optimizer)
+            grad_scaler.update()
             scheduler.step()
             step_counter += 1
 
@@ -168,6 +186,7 @@ def train_loop(net,
         torch.save({
             "model"       : net.state_dict(),
             "optimizer"   : optimizer.state_dict(),
+            "scaler"      : grad_scaler.state_dict(),
             "step_counter": step_counter,
             "scheduler"   : scheduler.state_dict(),
             "default_emb" : default_embedding,
@@ -240,25 +259,19 @@ def calc_gan_outputs(real_spectrograms, fake_spectrograms, spectrogram_lengths,
 def get_random_window(generated_sequences, real_sequences, lengths):
     """
     This will return a randomized but consistent window of each that can be passed to the discriminator
-    Suboptimal runtime because of a loop, should not be too bad, but a fix would be nice.
+    Sequences that are shorter than the window are repeated until they fill it, which is the same as
+    indexing them modulo their length, so all windows are collected with one gather instead of a loop.
     """
-    generated_windows = list()
-    real_windows = list()
     window_size = 100  # corresponds to 1.6 seconds of audio in real time
 
-    for end_index, generated, real in zip(lengths.squeeze(), generated_sequences, real_sequences):
-
-        length = end_index
-        real_spec_unpadded = real[:end_index]
-        fake_spec_unpadded = generated[:end_index]
-        while length < window_size:
-            real_spec_unpadded = real_spec_unpadded.repeat((2, 1))
-            fake_spec_unpadded = fake_spec_unpadded.repeat((2, 1))
-            length = length * 2
-
-        max_start = length - window_size
-        start = random.randint(0, max_start)
+    starts = list()
+    unpadded_lengths = lengths.view(-1).tolist()
+    for length in unpadded_lengths:
+        repeated_length = length
+        while repeated_length < window_size:
+            repeated_length = repeated_length * 2
+        starts.append(random.randint(0, repeated_length - window_size))
 
-        generated_windows.append(fake_spec_unpadded[start:start + window_size].unsqueeze(0))
-        real_windows.append(real_spec_unpadded[start:start + window_size].unsqueeze(0))
-    return torch.cat(generated_windows, dim=0), torch.cat(real_windows, dim=0)
+    window_indexes = (torch.tensor(starts).unsqueeze(1) + torch.arange(window_size).unsqueeze(0)) % torch.tensor(unpadded_lengths).unsqueeze(1)
+    window_indexes = window_indexes.to(generated_sequences.device).unsqueeze(-1).expand(-1, -1, generated_sequences.size(-1))
+    return generated_sequences.gather(1, window_indexes), real_sequences.gather(1, window_indexes)
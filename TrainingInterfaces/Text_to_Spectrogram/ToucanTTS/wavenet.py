@@ -27,10 +27,9 @@ from torch import nn
 
 
 def fused_add_tanh_sigmoid_multiply(input_a, input_b, n_channels):
-    n_channels_int = n_channels[0]
-    in_act = input_a + input_b
-    t_act = torch.tanh(in_act[:, :n_channels_int, :])
-    s_act = torch.sigmoid(in_act[:, n_channels_int:, :])
+    in_act = input_a + input_b if input_b is not None else input_a
+    t_act = torch.tanh(in_act[:, :n_channels, :])
+    s_act = torch.sigmoid(in_act[:, n_channels:, :])
     acts = t_act * s_act
     return acts
 
@@ -94,7 +93,6 @@ class WN(torch.nn.Module):
         if nonpadding is None:
             nonpadding = 1
         output = torch.zeros_like(x)
-        n_channels_tensor = torch.IntTensor([self.hidden_size])
 
         if cond is not None and not self.share_cond_layers:
             cond = self.cond_layer(cond)
@@ -106,9 +104,9 @@ class WN(torch.nn.Module):
                 cond_offset = i * 2 * self.hidden_size
                 cond_l = cond[:, cond_offset:cond_offset + 2 * self.hidden_size, :]
             else:
-                cond_l = torch.zeros_like(x_in)
+                cond_l = None  # no need to add a tensor of zeros
 
-            acts = fused_add_tanh_sigmoid_multiply(x_in, cond_l, n_channels_tensor)
+            acts = fused_add_tanh_sigmoid_multiply(x_in, cond_l, self.hidden_size)
 
             res_skip_acts = self.res_skip_layers[i](acts)
             if i < self.n_layers - 1:
@@ -7,6 +7,7 @@ from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.HiFiGAN import HiFiGANGenera
 from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.HiFiGANDataset import HiFiGANDataset
 from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.HiFiGAN_Discriminators import AvocodoHiFiGANJointDiscriminator
 from TrainingInterfaces.Spectrogram_to_Wave.HiFiGAN.hifigan_train_loop import train_loop
+from Utility.corpus_preparation import prepare_combined_file_list
 from Utility.path_to_transcript_dicts import *
 from Utility.storage_config import MODELS_DIR
 
@@ -25,43 +26,45 @@ def run(gpu_id, resume_checkpoint, finetune, resume, model_dir, use_wandb, wandb
     os.makedirs(model_save_dir, exist_ok=True)
 
     print("Preparing new data...")
-    file_lists_for_this_run_combined = list()
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_mls_italian().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_mls_french().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_mls_dutch().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_mls_polish().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_mls_spanish().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_mls_portuguese().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_karlsson().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_eva().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_bernd().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_friedrich().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_hokus().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_hui_others().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_elizabeth().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_nancy().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_hokuspokus().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_fluxsing().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_vctk().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_libritts_all_clean().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_ljspeech().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10cmn().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_vietTTS().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_thorsten().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10el().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10nl().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10fi().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10ru().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10hu().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10es().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_css10fr().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_nvidia_hifitts().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_spanish_blizzard_train().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_aishell3().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_VIVOS_viet().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_RAVDESS().keys())
-    file_lists_for_this_run_combined += list(build_path_to_transcript_dict_ESDS().keys())
-    file_lists_for_this_run_combined += list(build_file_list_singing_voice_audio_database())
+    file_list_builders = [
+        build_path_to_transcript_dict_mls_italian,
+        build_path_to_transcript_dict_mls_french,
+        build_path_to_transcript_dict_mls_dutch,
+        build_path_to_transcript_dict_mls_polish,
+        build_path_to_transcript_dict_mls_spanish,
+        build_path_to_transcript_dict_mls_portuguese,
+        build_path_to_transcript_dict_karlsson,
+        build_path_to_transcript_dict_eva,
+        build_path_to_transcript_dict_bernd,
+        build_path_to_transcript_dict_friedrich,
+        build_path_to_transcript_dict_hokus,
+        build_path_to_transcript_dict_hui_others,
+        build_path_to_transcript_dict_elizabeth,
+        build_path_to_transcript_dict_nancy,
+        build_path_to_transcript_dict_hokuspokus,
+        build_path_to_transcript_dict_fluxsing,
+        build_path_to_transcript_dict_vctk,
+        build_path_to_transcript_dict_libritts_all_clean,
+        build_path_to_transcript_dict_ljspeech,
+        build_path_to_transcript_dict_css10cmn,
+        build_path_to_transcript_dict_vietTTS,
+        build_path_to_transcript_dict_thorsten,
+        build_path_to_transcript_dict_css10el,
+        build_path_to_transcript_dict_css10nl,
+        build_path_to_transcript_dict_css10fi,
+        build_path_to_transcript_dict_css10ru,
+        build_path_to_transcript_dict_css10hu,
+        build_path_to_transcript_dict_css10es,
+        build_path_to_transcript_dict_css10fr,
+        build_path_to_transcript_dict_nvidia_hifitts,
+        build_path_to_transcript_dict_spanish_blizzard_train,
+        build_path_to_transcript_dict_aishell3,
+        build_path_to_transcript_dict_VIVOS_viet,
+        build_path_to_transcript_dict_RAVDESS,
+        build_path_to_transcript_dict_ESDS,
+        build_file_list_singing_voice_audio_database,
+    ]
+    file_lists_for_this_run_combined = prepare_combined_file_list(file_list_builders)
 
     train_set = HiFiGANDataset(list_of_paths=random.sample(file_lists_for_this_run_combined, 200000),  # adjust the sample size until it fits into RAM
                                use_random_corruption=False)
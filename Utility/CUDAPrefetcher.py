@@ -0,0 +1,58 @@
+import torch
+
+
+class CUDAPrefetcher:
+    """
+    Wraps a DataLoader and moves every batch to the device while the previous batch is still being processed.
+    On CUDA the copies are issued on a side stream one batch ahead, which only overlaps with the compute if
+    the loader pins its memory. On any other device the batches are simply moved when they are requested.
+
+    Batches can be tensors or (nested) lists and tuples of tensors, everything else is passed through as is.
+    """
+
+    def __init__(self, loader, device):
+        self.loader = loader
+        self.device = device
+        self.stream = torch.cuda.Stream(device=device) if device.type == "cuda" else None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        iterator = iter(self.loader)
+        if self.stream is None:
+            for batch in iterator:
+                yield _to_device(batch, self.device)
+            return
+        next_batch = self._preload(iterator)
+        while next_batch is not None:
+            torch.cuda.current_stream(self.device).wait_stream(self.stream)
+            batch = next_batch
+            # the memory was allocated on the side stream, so the allocator has to know that it is used on the main stream now
+            _record_stream(batch, torch.cuda.current_stream(self.device))
+            next_batch = self._preload(iterator)
+            yield batch
+
+    def _preload(self, iterator):
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self.stream):
+            return _to_device(batch, self.device)
+
+
+def _to_device(batch, device):
+    if isinstance(batch, torch.Tensor):
+        return batch.to(device, non_blocking=True)
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_to_device(element, device) for element in batch)
+    return batch
+
+
+def _record_stream(batch, stream):
+    if isinstance(batch, torch.Tensor):
+        batch.record_stream(stream)
+    elif isinstance(batch, (list, tuple)):
+        for element in batch:
+            _record_stream(element, stream)
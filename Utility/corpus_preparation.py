@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import torch.multiprocessing
 
@@ -30,8 +32,13 @@ def prepare_fastspeech_corpus(transcript_dict,
     return it.
 
     Skips parts that have been done before.
+
+    The transcript_dict can also be given as the function that builds it,
+    then it is only built if the cache does not exist yet.
     """
     if not os.path.exists(os.path.join(corpus_dir, "fast_train_cache.pt")):
+        if callable(transcript_dict):
+            transcript_dict = transcript_dict()
         if fine_tune_aligner:
             aligner_dir = os.path.join(corpus_dir, "Aligner")
             aligner_loc = os.path.join(corpus_dir, "Aligner", "aligner.pt")
@@ -71,3 +78,25 @@ def prepare_fastspeech_corpus(transcript_dict,
                              lang=lang,
                              ctc_selection=ctc_selection,
                              save_imgs=save_imgs)
+
+
+def prepare_combined_file_list(file_list_builders, max_workers=8):
+    """
+    Run the functions that build the file lists or transcript dicts
+    of several corpora and concatenate the paths they return.
+
+    The builders mostly wait for the file system, so they
+    are run in threads, which speeds up the startup considerably.
+    """
+    combined_file_list = list()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_list in executor.map(_build_file_list, file_list_builders):  # map keeps the order, so sampling from the result stays reproducible
+            combined_file_list += file_list
+    return combined_file_list
+
+
+def _build_file_list(builder):
+    file_list = builder()
+    if isinstance(file_list, dict):
+        return list(file_list.keys())
+    return list(file_list)
@@ -386,20 +386,24 @@ def make_pad_mask(lengths, xs=None, length_dim=-1, device=None):
     if length_dim == 0:
         raise ValueError("length_dim cannot be 0: {}".format(length_dim))
 
-    if not isinstance(lengths, list):
-        lengths = lengths.tolist()
-    bs = int(len(lengths))
-    if xs is None:
-        maxlen = int(max(lengths))
-    else:
-        maxlen = xs.size(length_dim)
-
-    if device is not None:
+    if isinstance(lengths, torch.Tensor):
+        # the lengths are compared where they already are, instead of being copied into a python list and back
+        bs = lengths.size(0)
+        if xs is None:
+            maxlen = int(lengths.max())
+        else:
+            maxlen = xs.size(length_dim)  # given a reference tensor, nothing has to be read back from the device at all
         seq_range = torch.arange(0, maxlen, dtype=torch.int64, device=device)
+        seq_length_expand = lengths.to(device=seq_range.device, dtype=torch.int64).unsqueeze(-1)
     else:
-        seq_range = torch.arange(0, maxlen, dtype=torch.int64)
+        bs = int(len(lengths))
+        if xs is None:
+            maxlen = int(max(lengths))
+        else:
+            maxlen = xs.size(length_dim)
+        seq_range = torch.arange(0, maxlen, dtype=torch.int64, device=device)
+        seq_length_expand = seq_range.new(lengths).unsqueeze(-1)
     seq_range_expand = seq_range.unsqueeze(0).expand(bs, maxlen)
-    seq_length_expand = seq_range_expand.new(lengths).unsqueeze(-1)
     mask = seq_range_expand >= seq_length_expand
 
     if xs is not None:
@@ -444,19 +448,17 @@ def initialize(model, init):
         init: Method of initialization.
     """
 
+    from Layers.Attention import MultiHeadedAttention  # imported here, because the attention layers import this module themselves
+
     # weight init
     for p in model.parameters():
         if p.dim() > 1:
-            if init == "xavier_uniform":
-                torch.nn.init.xavier_uniform_(p.data)
-            elif init == "xavier_normal":
-                torch.nn.init.xavier_normal_(p.data)
-            elif init == "kaiming_uniform":
-                torch.nn.init.kaiming_uniform_(p.data, nonlinearity="relu")
-            elif init == "kaiming_normal":
-                torch.nn.init.kaiming_normal_(p.data, nonlinearity="relu")
-            else:
-                raise ValueError("Unknown initialization: " + init)
+            _initialize_weight(p.data, init)
+    # the stacked query, key and value projections are initialized like three separate layers, so their fans stay the same
+    for m in model.modules():
+        if isinstance(m, MultiHeadedAttention) and hasattr(m, "linear_qkv"):  # subclasses with differently sized inputs keep separate projections
+            for weight in m.linear_qkv.weight.data.chunk(3, dim=0):
+                _initialize_weight(weight, init)
     # bias init
     for p in model.parameters():
         if p.dim() == 1:
@@ -472,6 +474,19 @@ def initialize(model, init):
             m.reset_parameters()
 
 
+def _initialize_weight(weight, init):
+    if init == "xavier_uniform":
+        torch.nn.init.xavier_uniform_(weight)
+    elif init == "xavier_normal":
+        torch.nn.init.xavier_normal_(weight)
+    elif init == "kaiming_uniform":
+        torch.nn.init.kaiming_uniform_(weight, nonlinearity="relu")
+    elif init == "kaiming_normal":
+        torch.nn.init.kaiming_normal_(weight, nonlinearity="relu")
+    else:
+        raise ValueError("Unknown initialization: " + init)
+
+
 def pad_list(xs, pad_value):
     """
     Perform padding for the list of tensors.
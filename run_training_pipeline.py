@@ -99,6 +99,11 @@ if __name__ == '__main__':
     random.seed(131714)
     torch.random.manual_seed(131714)
 
+    # TF32 runs the float32 matmuls and convolutions on tensor cores (Ampere and newer), with a precision that is plenty for training.
+    # cudnn.benchmark is left off, the lengths change with every batch, so it would keep re-tuning instead of reusing its choices.
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
     pipeline_dict[args.pipeline](gpu_id=args.gpu_id,
                                  resume_checkpoint=args.resume_checkpoint,
                                  resume=args.resume,